@@ -1,15 +1,29 @@
 from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 import uuid
 import os
+import re
+import asyncio
+import time
+import datetime
+import hashlib
+from array import array
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import requests
-from bs4 import BeautifulSoup
+import httpx
+from cachetools import LRUCache, TTLCache
+import redis.asyncio as redis
+from redis.commands.search.field import TagField, TextField, VectorField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+from lxml import etree
+from html_encoding import sniff_encoding
+import orjson
 import google.generativeai as genai
 import sys
 
@@ -38,10 +52,86 @@ try:
 except Exception as e:
     print(f"Error initializing Gemini Model: {e}")
 
+class RedisSemanticCache:
+    """Stores AI answers in a Redis Stack vector index keyed by question embedding.
+
+    Lookups are scoped to a namespace so answers are only reused for the same
+    set of documents.
+    """
+    INDEX_NAME = "idx:semantic_cache"
+    KEY_PREFIX = "semcache:"
+    EMBEDDING_MODEL = 'models/text-embedding-004'
+    EMBEDDING_DIM = 768
+
+    def __init__(self, redis_url, score_threshold=0.15, ttl=datetime.timedelta(days=1)):
+        self.redis = redis.from_url(redis_url)
+        self.score_threshold = score_threshold
+        self.ttl = ttl
+
+    async def create_index(self):
+        index = self.redis.ft(self.INDEX_NAME)
+        try:
+            await index.info()
+        except redis.ResponseError:
+            await index.create_index(
+                [
+                    TagField("namespace"),
+                    TextField("answer"),
+                    VectorField("embedding", "HNSW", {
+                        "TYPE": "FLOAT32",
+                        "DIM": self.EMBEDDING_DIM,
+                        "DISTANCE_METRIC": "COSINE",
+                    }),
+                ],
+                definition=IndexDefinition(prefix=[self.KEY_PREFIX], index_type=IndexType.HASH),
+            )
+            print(f"Created Redis semantic cache index {self.INDEX_NAME}")
+
+    async def embed(self, question):
+        result = await asyncio.to_thread(
+            genai.embed_content, model=self.EMBEDDING_MODEL, content=question, task_type='retrieval_query'
+        )
+        return array('f', result['embedding']).tobytes()
+
+    async def lookup(self, namespace, embedding):
+        query = (
+            Query(f"(@namespace:{{{namespace}}})=>[KNN 1 @embedding $vec AS score]")
+            .sort_by("score")
+            .return_fields("answer", "score")
+            .dialect(2)
+        )
+        result = await self.redis.ft(self.INDEX_NAME).search(query, query_params={"vec": embedding})
+        if result.docs and float(result.docs[0].score) <= self.score_threshold:
+            return result.docs[0].answer
+        return None
+
+    async def store(self, namespace, embedding, answer):
+        key = f"{self.KEY_PREFIX}{namespace}:{uuid.uuid4().hex}"
+        await self.redis.hset(key, mapping={"namespace": namespace, "answer": answer, "embedding": embedding})
+        await self.redis.expire(key, self.ttl)
+
+# Semantic answer cache is optional and only enabled when REDIS_URL is set
+redis_url = os.environ.get("REDIS_URL")
+semantic_cache = RedisSemanticCache(redis_url) if redis_url else None
+if not semantic_cache:
+    print("REDIS_URL not set. Semantic answer cache disabled.")
+
 app = FastAPI()
 
+# Explicit pool settings so concurrent chats don't queue on Prisma's small
+# default pool. Values already present in DATABASE_URL take precedence.
+PRISMA_POOL_SETTINGS = {"connection_limit": "20", "pool_timeout": "10", "connect_timeout": "5"}
+
+def with_pool_settings(database_url):
+    parts = urlsplit(database_url)
+    query = dict(parse_qsl(parts.query))
+    for key, value in PRISMA_POOL_SETTINGS.items():
+        query.setdefault(key, value)
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
 # Initialize Prisma Client
-db = Prisma()
+database_url = os.environ.get("DATABASE_URL")
+db = Prisma(datasource={"url": with_pool_settings(database_url)}) if database_url else Prisma()
 
 # Pydantic model for the /api/chat request
 class ChatRequest(BaseModel):
@@ -71,44 +161,157 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 @app.on_event("startup")
 async def startup_db_client():
+    # Shared HTTP client so concurrent scrapes reuse pooled keep-alive connections
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=64),
+        retries=2,
+    )
+    app.state.http = httpx.AsyncClient(transport=transport, timeout=10, follow_redirects=True)
+    # lxml releases the GIL while parsing, so page parses run in parallel
+    app.state.parse_pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="parse")
     try:
         await db.connect()
+        # Open a pooled connection now instead of on the first request
+        await db.query_raw("SELECT 1")
         print("Prisma client connected successfully.")
     except Exception as e:
         print(f"Failed to connect Prisma client: {e}")
+    if semantic_cache:
+        try:
+            await semantic_cache.create_index()
+        except Exception as e:
+            print(f"Failed to create Redis semantic cache index: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await app.state.http.aclose()
+    app.state.parse_pool.shutdown(wait=False)
+    if semantic_cache:
+        await semantic_cache.redis.aclose()
     if db.is_connected():
         await db.disconnect()
         print("Prisma client disconnected.")
 
-def scrape_website(url):
+SCRAPE_CHUNK_SIZE = 32768
+# Pages beyond this are truncated so one huge URL can't exhaust worker memory
+SCRAPE_MAX_BYTES = 4_000_000
+# Whitespace normalization for scraped text, applied in one pass per page
+_WS = re.compile(r'[ \t\xa0]+')
+_NL = re.compile(r'\s*\n\s*')
+
+class TextCollector:
+    """lxml parser target that collects page text, skipping script/style subtrees.
+
+    Text is accumulated as the parser emits it, so no DOM is ever built.
+    """
+    SKIP_TAGS = {"script", "style", "noscript"}
+
+    def __init__(self):
+        self.parts = []
+        self.pending = []
+        self.skip_depth = 0
+
+    def _flush(self):
+        if self.pending:
+            self.parts.append("".join(self.pending))
+            self.pending = []
+
+    def start(self, tag, attrib):
+        self._flush()
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+
+    def end(self, tag):
+        self._flush()
+        if tag in self.SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.pending.append(data)
+
+    def close(self):
+        self._flush()
+        return _NL.sub("\n", _WS.sub(" ", "\n".join(self.parts))).strip()
+
+def make_parser(encoding):
+    try:
+        return etree.HTMLParser(target=TextCollector(), encoding=encoding)
+    except LookupError:
+        # libxml2 doesn't know this encoding name; let it detect one
+        return etree.HTMLParser(target=TextCollector())
+
+# Cleaned page text keyed by URL: (text, etag, last_modified, fetched_at).
+# Entries younger than SCRAPE_CACHE_TTL are served without any network I/O;
+# older ones are revalidated with a conditional GET.
+SCRAPE_CACHE_TTL = 3600
+scrape_cache = LRUCache(maxsize=1024)
+
+async def scrape_website(client: httpx.AsyncClient, url):
+    cached = scrape_cache.get(url)
+    if cached and time.monotonic() - cached[3] < SCRAPE_CACHE_TTL:
+        return cached[0]
+    headers = {}
+    if cached:
+        if cached[1]:
+            headers["If-None-Match"] = cached[1]
+        if cached[2]:
+            headers["If-Modified-Since"] = cached[2]
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        for script_or_style in soup(["script", "style"]):
-            script_or_style.decompose()
-        text = soup.get_text()
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
+        async with client.stream("GET", url, headers=headers) as response:
+            if cached and response.status_code == 304:
+                scrape_cache[url] = (cached[0], cached[1], cached[2], time.monotonic())
+                return cached[0]
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "")
+            if content_type and not (content_type.startswith("text/") or "html" in content_type):
+                raise ValueError(f"Unsupported content type: {content_type}")
+            # Feed the body to lxml as it arrives so parsing overlaps the download.
+            # Parsing is CPU-bound; keep it off the event loop.
+            loop = asyncio.get_running_loop()
+            parser = None
+            received = 0
+            async for chunk in response.aiter_bytes(SCRAPE_CHUNK_SIZE):
+                if parser is None:
+                    # Only trust a declared charset; otherwise sniff the first chunk
+                    parser = make_parser(response.charset_encoding or sniff_encoding(chunk))
+                remaining = SCRAPE_MAX_BYTES - received
+                received += len(chunk)
+                if received > SCRAPE_MAX_BYTES:
+                    print(f"Truncating {url} at {SCRAPE_MAX_BYTES} bytes")
+                    await loop.run_in_executor(app.state.parse_pool, parser.feed, chunk[:remaining])
+                    break
+                await loop.run_in_executor(app.state.parse_pool, parser.feed, chunk)
+            text = await loop.run_in_executor(app.state.parse_pool, parser.close) if parser else ""
+        scrape_cache[url] = (text, response.headers.get("ETag"), response.headers.get("Last-Modified"), time.monotonic())
         return text
     except Exception as e:
         print(f"Error during website scraping ({url}): {e}")
         return f"Error scraping website ({url}): {e}"
 
-def scrape_multiple_websites(urls: list[str]) -> str:
+async def scrape_multiple_websites(client: httpx.AsyncClient, urls: list[str]) -> tuple[str, int]:
+    """Returns the combined document text and how many URLs failed to scrape."""
+    print(f"Scraping {len(urls)} URL(s): {urls}")
+    if len(urls) == 1:
+        # Most chats have a single URL; skip the gather and per-URL headers
+        text = await scrape_website(client, urls[0])
+        if text.startswith("Error scraping website"):
+            return f"Failed to scrape {urls[0]}. Error: {text.split(': ', 1)[1]}", 1
+        return text, 0
+    texts = await asyncio.gather(*(scrape_website(client, url) for url in urls))
     all_text = []
-    for url in urls:
-        print(f"Scraping {url}...")
-        text = scrape_website(url)
+    failed = 0
+    for url, text in zip(urls, texts):
         if text.startswith("Error scraping website"):
+            failed += 1
             all_text.append(f"Failed to scrape {url}. Error: {text.split(': ', 1)[1]}")
         else:
             all_text.append(f"Content from {url}:\n{text}\n---")
-    return "\n\n".join(all_text)
+    return "\n\n".join(all_text), failed
+
+def build_prompt(document_text, question):
+    return f"Based on the following document, please answer the question.\n\nDocument:\n{document_text[:10000]} \n\nQuestion: {question}"
 
 def ask_ai(document_text, question):
     if not model:
@@ -118,18 +321,101 @@ def ask_ai(document_text, question):
         print("No valid document content to answer from.")
         return "No document content to answer from."
     try:
-        prompt = f"Based on the following document, please answer the question.\n\nDocument:\n{document_text[:10000]} \n\nQuestion: {question}"
-        response = model.generate_content(prompt)
+        response = model.generate_content(build_prompt(document_text, question))
         return response.text
     except Exception as e:
         print(f"Error interacting with AI: {e}")
         return f"Error interacting with AI: {e}"
 
+# Gemini context caching only works with explicitly versioned models and
+# rejects documents below its minimum token count (~4 chars per token).
+CACHE_MODEL_NAME = 'models/gemini-1.5-flash-001'
+CACHE_TTL = datetime.timedelta(hours=1)
+CACHE_MIN_CHARS = 32768 * 4
+# Cached tokens are billed on every question, so bound how much of the
+# document is cached (~250k tokens).
+CACHE_MAX_CHARS = 250000 * 4
+
+# Live CachedContent handles keyed by cache name. Entries are dropped well
+# before the CACHE_TTL they were refreshed to, so a hit is always still valid
+# on the Gemini side and needs no get/update round-trip.
+active_document_caches = TTLCache(maxsize=512, ttl=1800)
+
+# The Gemini calls below block, so they run in worker threads while
+# active_document_caches (not thread-safe) is only touched on the event loop.
+async def create_document_cache(document_text):
+    if len(document_text) < CACHE_MIN_CHARS:
+        return None
+    try:
+        cached_content = await asyncio.to_thread(
+            genai.caching.CachedContent.create,
+            model=CACHE_MODEL_NAME,
+            system_instruction="Answer the user's questions based on the provided document.",
+            contents=[document_text[:CACHE_MAX_CHARS]],
+            ttl=CACHE_TTL,
+        )
+    except Exception as e:
+        print(f"Error creating Gemini context cache: {e}")
+        return None
+    print(f"Created Gemini context cache {cached_content.name}")
+    active_document_caches[cached_content.name] = cached_content
+    return cached_content
+
+def refresh_document_cache(name):
+    cached_content = genai.caching.CachedContent.get(name)
+    # Push the expiry back while the chat is still in use
+    cached_content.update(ttl=CACHE_TTL)
+    return cached_content
+
+async def get_document_cache(name):
+    cached_content = active_document_caches.get(name)
+    if cached_content:
+        return cached_content
+    try:
+        cached_content = await asyncio.to_thread(refresh_document_cache, name)
+    except Exception as e:
+        print(f"Gemini context cache {name} unavailable: {e}")
+        return None
+    active_document_caches[name] = cached_content
+    return cached_content
+
+def url_set_namespace(urls: list[str]) -> str:
+    return hashlib.sha256("\n".join(sorted(urls)).encode()).hexdigest()
+
+async def stream_ai_answer(question, cached_content=None, document_text=None):
+    """Yields answer text from Gemini as it is generated, preferring the context cache."""
+    if cached_content:
+        cached_model = genai.GenerativeModel.from_cached_content(cached_content)
+        response = await cached_model.generate_content_async(question, stream=True)
+    else:
+        response = await model.generate_content_async(build_prompt(document_text, question), stream=True)
+    async for chunk in response:
+        yield chunk.text
+
+def orjson_default(obj):
+    # Prisma records are Pydantic models
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    raise TypeError
+
+def fast_json(obj, status_code=200):
+    # Serializes Prisma records in C instead of walking them with jsonable_encoder
+    return Response(
+        orjson.dumps(obj, default=orjson_default, option=orjson.OPT_NAIVE_UTC),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {orjson.dumps(data, default=orjson_default).decode()}\n\n"
+
 @app.post("/api/ask")
 async def api_ask(data: dict):
     url = data.get("url")
     question = data.get("question")
-    doc = scrape_website(url)
+    doc = await scrape_website(app.state.http, url)
     answer = ask_ai(doc, question)
     return JSONResponse({"answer": answer})
 
@@ -137,85 +423,160 @@ async def api_ask(data: dict):
 async def api_chat(data: ChatRequest):
     if not data.urls:
         return JSONResponse({"error": "No URLs provided.", "answer": "Please provide at least one URL."}, status_code=400)
-
-    scraped_doc_text = scrape_multiple_websites(data.urls)  # Use new multi-scrape function
-    
-    # Check if all scraping failed
-    if all(text.startswith("Failed to scrape") for text in scraped_doc_text.split("\n\n") if text.strip()):
-        return JSONResponse({"error": "Failed to scrape all provided URLs.", "answer": "Could not retrieve content from any of the URLs."}, status_code=500)
-
-    ai_answer = ask_ai(scraped_doc_text, data.question)
-    if ai_answer.startswith("Error interacting with AI:") or ai_answer == "AI Model not initialized." or ai_answer == "No document content to answer from.":
-        return JSONResponse({"error": ai_answer, "answer": "Failed to get a response from the AI."}, status_code=500)
+    if not model:
+        print("AI Model not initialized. Cannot ask AI.")
+        return JSONResponse({"error": "AI Model not initialized.", "answer": "Failed to get a response from the AI."}, status_code=500)
 
     try:
-        user = await db.user.upsert(
-            where={"id": data.userId},
-            data={
-                "create": {"id": data.userId, "email": f"user_{data.userId}@example.com"},
-                "update": {},
-            },
-        )
-        if not user:
-            print(f"Failed to upsert user with ID: {data.userId}")
-            return JSONResponse({"error": "Failed to process user information.", "answer": "Error with user data."}, status_code=500)
-
         chat_session = None
         if data.chatId:
-            chat_session = await db.chat.find_unique(where={"id": data.chatId})
-            if chat_session and chat_session.userId != user.id:
+            # Messages are loaded up front so the response can be built without re-reading the chat
+            chat_session = await db.chat.find_unique(where={"id": data.chatId}, include={"messages": True})
+            if chat_session and chat_session.userId != data.userId:
                 print(f"User {data.userId} attempted to write to chat {data.chatId} owned by {chat_session.userId}")
                 return JSONResponse({"error": "Unauthorized access to chat session.", "answer": "Unauthorized."}, status_code=403)
             elif not chat_session:
                 print(f"ChatId {data.chatId} provided but not found. Creating a new chat.")
+    except Exception as e:
+        print(f"Database operation or chat processing failed: {e}") 
+        return JSONResponse({"error": f"An unexpected error occurred: {str(e)}", "answer": "An error occurred."}, status_code=500)
 
-        if not chat_session:
-            title = data.urls[0] if data.urls else "Chat"
-            chat_session = await db.chat.create(
-                data={
-                    "userId": user.id,
-                    "title": title,
-                    "urls": data.urls  # Store the list of URLs
-                }
-            )
-            print(f"Created new chat session {chat_session.id} for user {user.id} with title '{title}' and URLs: {data.urls}")
+    async def stream_generator():
+        # The response starts immediately: "status" events report the scrape
+        # and cache phases, answer text follows as "token" events while Gemini
+        # generates it, and the stored chat comes last as one "metadata" event.
+        cached_answer = None
+        question_embedding = None
+        namespace = url_set_namespace(data.urls)
+        cached_content = None
+        cached_content_name = chat_session.cachedContentName if chat_session else None
+        scraped_doc_text = None
+        try:
+            # Near-identical questions about the same documents skip Gemini entirely
+            if semantic_cache:
+                try:
+                    question_embedding = await semantic_cache.embed(data.question)
+                    cached_answer = await semantic_cache.lookup(namespace, question_embedding)
+                except Exception as e:
+                    print(f"Semantic cache lookup failed: {e}")
+                if cached_answer:
+                    print(f"Semantic cache hit for URLs {data.urls}")
+
+            if not cached_answer:
+                # Reuse the chat's Gemini context cache instead of rescraping and
+                # resending the document; only scrape when no live cache exists.
+                if chat_session and chat_session.cachedContentName and chat_session.urls == data.urls:
+                    cached_content = await get_document_cache(chat_session.cachedContentName)
+                if not cached_content:
+                    yield sse_event("status", "scraping")
+                    scraped_doc_text, failed = await scrape_multiple_websites(app.state.http, data.urls)  # Use new multi-scrape function
+
+                    # Check if all scraping failed
+                    if failed == len(data.urls):
+                        yield sse_event("error", {"error": "Failed to scrape all provided URLs.", "answer": "Could not retrieve content from any of the URLs."})
+                        return
+
+                    if len(scraped_doc_text) >= CACHE_MIN_CHARS:
+                        yield sse_event("status", "warming")
+                    cached_content = await create_document_cache(scraped_doc_text)
+                cached_content_name = cached_content.name if cached_content else None
+        except Exception as e:
+            print(f"Database operation or chat processing failed: {e}") 
+            yield sse_event("error", {"error": f"An unexpected error occurred: {str(e)}", "answer": "An error occurred."})
+            return
+
+        if cached_answer:
+            ai_answer = cached_answer
+            yield sse_event("token", ai_answer)
         else:
-            if chat_session.urls != data.urls:
-                print(f"Updating URLs for chat {chat_session.id} from {chat_session.urls} to {data.urls}")
-                await db.chat.update(
-                    where={"id": chat_session.id},
-                    data={"urls": data.urls}
-                )
-
-        await db.message.create_many(
-            data=[
+            yield sse_event("status", "thinking")
+            answer_parts = []
+            try:
+                async for text in stream_ai_answer(data.question, cached_content, scraped_doc_text):
+                    answer_parts.append(text)
+                    yield sse_event("token", text)
+            except Exception as e:
+                print(f"Error interacting with AI: {e}")
+                yield sse_event("error", {"error": f"Error interacting with AI: {e}", "answer": "Failed to get a response from the AI."})
+                return
+            ai_answer = "".join(answer_parts)
+
+            if semantic_cache and question_embedding:
+                try:
+                    await semantic_cache.store(namespace, question_embedding, ai_answer)
+                except Exception as e:
+                    print(f"Failed to store answer in semantic cache: {e}")
+
+        try:
+            # Ids and timestamps are generated here so every write fits in one batch
+            # and the response can be built from data already in hand.
+            now = datetime.datetime.now(datetime.timezone.utc)
+            chat_id = chat_session.id if chat_session else str(uuid.uuid4())
+            title = chat_session.title if chat_session else data.urls[0]
+            new_messages = [
                 {
-                    "chatId": chat_session.id,
+                    "id": str(uuid.uuid4()),
+                    "chatId": chat_id,
                     "role": "user",
                     "content": data.question,
+                    "createdAt": now,
                 },
                 {
-                    "chatId": chat_session.id,
+                    "id": str(uuid.uuid4()),
+                    "chatId": chat_id,
                     "role": "ai",
                     "content": ai_answer,
+                    "createdAt": now,
                 }
             ]
-        )
-        
-        updated_chat_with_messages = await db.chat.find_unique(
-            where={"id": chat_session.id},
-            include={"messages": True}
-        )
-
-        print(f"Chat interaction stored for user {data.userId}, chat ID {chat_session.id}")
-        return JSONResponse({
-            "answer": ai_answer, 
-            "chat": jsonable_encoder(updated_chat_with_messages) if updated_chat_with_messages else None
-        })
 
-    except Exception as e:
-        print(f"Database operation or chat processing failed: {e}") 
-        return JSONResponse({"error": f"An unexpected error occurred: {str(e)}", "answer": "An error occurred."}, status_code=500)
+            async with db.batch_() as batcher:
+                batcher.user.upsert(
+                    where={"id": data.userId},
+                    data={
+                        "create": {"id": data.userId, "email": f"user_{data.userId}@example.com"},
+                        "update": {},
+                    },
+                )
+                if not chat_session:
+                    batcher.chat.create(
+                        data={
+                            "id": chat_id,
+                            "userId": data.userId,
+                            "title": title,
+                            "urls": data.urls,  # Store the list of URLs
+                            "cachedContentName": cached_content_name,
+                            "createdAt": now,
+                        }
+                    )
+                    print(f"Creating new chat session {chat_id} for user {data.userId} with title '{title}' and URLs: {data.urls}")
+                elif chat_session.urls != data.urls or chat_session.cachedContentName != cached_content_name:
+                    if chat_session.urls != data.urls:
+                        print(f"Updating URLs for chat {chat_id} from {chat_session.urls} to {data.urls}")
+                    batcher.chat.update(
+                        where={"id": chat_id},
+                        data={"urls": data.urls, "cachedContentName": cached_content_name}
+                    )
+                batcher.message.create_many(data=new_messages)
+
+            updated_chat_with_messages = {
+                "id": chat_id,
+                "userId": data.userId,
+                "title": title,
+                "urls": data.urls,
+                "cachedContentName": cached_content_name,
+                "createdAt": chat_session.createdAt if chat_session else now,
+                "messages": (list(chat_session.messages or []) if chat_session else []) + new_messages,
+            }
+
+            print(f"Chat interaction stored for user {data.userId}, chat ID {chat_id}")
+            yield sse_event("metadata", {"answer": ai_answer, "chat": updated_chat_with_messages})
+
+        except Exception as e:
+            print(f"Database operation or chat processing failed: {e}") 
+            yield sse_event("error", {"error": f"An unexpected error occurred: {str(e)}", "answer": "An error occurred."})
+
+    return StreamingResponse(stream_generator(), media_type="text/event-stream")
 
 @app.put("/api/chats/{chat_id}/rename")
 async def rename_chat_session(chat_id: str, request_data: RenameChatRequest):
@@ -238,7 +599,7 @@ async def rename_chat_session(chat_id: str, request_data: RenameChatRequest):
             return JSONResponse({"error": "Failed to rename chat session."}, status_code=500)
         
         print(f"Chat {chat_id} renamed to '{request_data.title}' by user {request_data.userId}")
-        return JSONResponse(jsonable_encoder(updated_chat))
+        return fast_json(updated_chat)
 
     except Exception as e:
         print(f"Error renaming chat {chat_id}: {e}")
@@ -254,12 +615,12 @@ async def get_user_chats(user_id: str):
         chats = await db.chat.find_many(
             where={"userId": user_id},
             include={"messages": True},
-            order={"createdAt": "desc"}
+            order={"createdAt": "desc"},
+            take=50,  # Served by the (userId, createdAt DESC) index
         )
         if not chats:
             return JSONResponse([], status_code=200)
-        # Manually serialize to handle Pydantic models within a list
-        return JSONResponse(jsonable_encoder(chats))
+        return fast_json(chats)
     except Exception as e:
         print(f"Error fetching chats for user {user_id}: {e}")
         return JSONResponse({"error": f"Failed to fetch chats: {str(e)}"}, status_code=500)
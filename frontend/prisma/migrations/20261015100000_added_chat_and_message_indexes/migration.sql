@@ -0,0 +1,5 @@
+-- CreateIndex
+CREATE INDEX "Chat_userId_createdAt_idx" ON "Chat"("userId", "createdAt" DESC);
+
+-- CreateIndex
+CREATE INDEX "Message_chatId_idx" ON "Message"("chatId");
@@ -37,6 +37,7 @@ import {
   setInput,
   setLoading,
   addMessage,
+  updateLastMessage,
   addChat,
   updateChatTitle,
   deleteChat as deleteChatAction,
@@ -66,6 +67,32 @@ interface Chat {
   messages: Message[];
 }
 
+// Placeholder text shown while /api/chat reports progress before the answer
+const STREAM_STATUS_TEXT: Record<string, string> = {
+  scraping: "Reading the documentation...",
+  warming: "Preparing the documents...",
+  thinking: "Thinking...",
+};
+
+interface ChatStreamPayload {
+  error?: string;
+  chat?: Chat;
+}
+
+// Splits one server-sent event block into its event name and JSON payload
+function parseSseEvent(block: string): { event: string; data: unknown } {
+  let event = "message";
+  const dataLines: string[] = [];
+  for (const line of block.split("\n")) {
+    if (line.startsWith("event:")) event = line.slice(6).trim();
+    else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim());
+  }
+  return {
+    event,
+    data: dataLines.length ? JSON.parse(dataLines.join("\n")) : null,
+  };
+}
+
 export default function EditorPage() {
   const { isSignedIn, user } = useUser();
   const dispatch = useDispatch<AppDispatch>();
@@ -264,36 +291,62 @@ export default function EditorPage() {
           chatId: selectedChatId,
         }),
       });
-      const data = await res.json();
-
-      if (res.ok) {
-        dispatch(addMessage({ role: "ai", content: data.answer }));
-
-        if (data.chat) {
-          const serverChat = data.chat as Chat;
-          if (!selectedChatId || selectedChatId !== serverChat.id) {
-            dispatch(addChat(serverChat));
-            dispatch(setSelectedChatId(serverChat.id));
-          } else {
-            const existingChatIndex = chats.findIndex(
-              (c) => c.id === serverChat.id
-            );
-            if (existingChatIndex !== -1) {
-              const updatedChats = [...chats];
-              updatedChats[existingChatIndex] = serverChat;
-              dispatch(setChats(updatedChats));
-            } else {
-              dispatch(addChat(serverChat));
-            }
-          }
-        }
-      } else {
+      if (!res.ok || !res.body) {
+        const data = await res.json();
         dispatch(
           addMessage({
             role: "ai",
             content: data.error || "Error: Could not get answer.",
           })
         );
+      } else {
+        // Progress arrives as "status" events, the answer streams in as "token"
+        // events, and the saved chat arrives last as a "metadata" event.
+        dispatch(addMessage({ role: "ai", content: "" }));
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let answer = "";
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          let boundary;
+          while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+            const { event, data } = parseSseEvent(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+            const payload = data as ChatStreamPayload | null;
+            if (event === "status" && typeof data === "string" && !answer) {
+              dispatch(updateLastMessage(STREAM_STATUS_TEXT[data] ?? ""));
+            } else if (event === "token" && typeof data === "string") {
+              answer += data;
+              dispatch(updateLastMessage(answer));
+            } else if (event === "error") {
+              dispatch(
+                updateLastMessage(
+                  payload?.error || "Error: Could not get answer."
+                )
+              );
+            } else if (event === "metadata" && payload?.chat) {
+              const serverChat = payload.chat;
+              if (!selectedChatId || selectedChatId !== serverChat.id) {
+                dispatch(addChat(serverChat));
+                dispatch(setSelectedChatId(serverChat.id));
+              } else {
+                const existingChatIndex = chats.findIndex(
+                  (c) => c.id === serverChat.id
+                );
+                if (existingChatIndex !== -1) {
+                  const updatedChats = [...chats];
+                  updatedChats[existingChatIndex] = serverChat;
+                  dispatch(setChats(updatedChats));
+                } else {
+                  dispatch(addChat(serverChat));
+                }
+              }
+            }
+          }
+        }
       }
     } catch (error) {
       console.error("Error sending message:", error);
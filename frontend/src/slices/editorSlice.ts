@@ -54,6 +54,10 @@ const editorSlice = createSlice({
     addMessage(state, action: PayloadAction<Message>) {
       state.messages.push(action.payload);
     },
+    updateLastMessage(state, action: PayloadAction<string>) {
+      const last = state.messages[state.messages.length - 1];
+      if (last) last.content = action.payload;
+    },
     addChat(state, action: PayloadAction<Chat>) {
       state.chats.unshift(action.payload);
     },
@@ -90,6 +94,7 @@ export const {
   setInput,
   setLoading,
   addMessage,
+  updateLastMessage,
   addChat,
   updateChatTitle,
   deleteChat,
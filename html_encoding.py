@@ -0,0 +1,46 @@
+# html_encoding.py
+import codecs
+import re
+
+# A BOM or <meta charset> in the page is honoured by lxml itself
+_META_CHARSET = re.compile(rb'<meta[^>]+charset', re.I)
+
+# charset_normalizer guesses that are trusted over the cp1252 default, mapped
+# to names libxml2 knows. Only non-Latin scripts are listed: for short Western
+# pages it confidently picks the wrong Latin code page (cp1250, hp-roman8),
+# where cp1252 is right far more often.
+_TRUSTED_GUESSES = {
+    'cp1251': 'cp1251', 'koi8_r': 'koi8-r',
+    'cp1253': 'cp1253', 'iso8859_7': 'iso-8859-7',
+    'cp1255': 'cp1255', 'iso8859_8': 'iso-8859-8',
+    'cp1256': 'cp1256',
+    'cp874': 'cp874', 'tis_620': 'tis-620',
+    'cp932': 'cp932', 'shift_jis': 'shift_jis', 'euc_jp': 'euc-jp', 'euc_jis_2004': 'euc-jp',
+    'gb2312': 'gb2312', 'gbk': 'gbk', 'gb18030': 'gb18030', 'big5': 'big5',
+    'cp949': 'cp949', 'euc_kr': 'euc-kr',
+}
+MAX_GUESS_CHAOS = 0.1
+
+def sniff_encoding(head):
+    """Picks an encoding for a page served without a charset, from its first chunk.
+
+    Returns None when lxml can detect the encoding from the page itself (BOM or
+    <meta charset>). Otherwise UTF-8 if the bytes decode as it, then a confident
+    charset_normalizer guess for non-Latin scripts, and cp1252 (the WHATWG
+    default for such pages) for everything else. Without this, lxml would
+    decode UTF-8 pages as Latin-1.
+    """
+    if head.startswith((codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)) or _META_CHARSET.search(head):
+        return None
+    try:
+        head.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # A character split across the chunk boundary is still UTF-8
+        if e.reason == 'unexpected end of data':
+            return 'utf-8'
+    from charset_normalizer import from_bytes
+    guess = from_bytes(head).best()
+    if guess and guess.chaos <= MAX_GUESS_CHAOS and guess.encoding in _TRUSTED_GUESSES:
+        return _TRUSTED_GUESSES[guess.encoding]
+    return 'cp1252'
@@ -1,9 +1,26 @@
 # main.py
 import os
+import re
+import sys
+import json
+import argparse
+import atexit
+import asyncio
+import datetime
+import functools
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from bs4 import BeautifulSoup
-import google.generativeai as genai
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from dotenv import load_dotenv # Import load_dotenv
+from html_encoding import sniff_encoding
+
+# google.generativeai, lxml and the optional sentence-transformers are imported
+# where they are used, so the URL prompt appears without waiting on them
 
 load_dotenv() # Load environment variables from .env file
 
@@ -15,60 +32,524 @@ if not gemini_api_key:
     print("Please set this environment variable with your Gemini API key and try again.")
     exit()
 
-genai.configure(api_key=gemini_api_key)
+@functools.lru_cache(maxsize=1)
+def get_model():
+    """Configures the Gemini API and returns the generative model, once."""
+    import google.generativeai as genai
+    genai.configure(api_key=gemini_api_key)
+    return genai.GenerativeModel('gemini-2.0-flash')
 
-# Initialize the generative model
-model = genai.GenerativeModel('gemini-2.0-flash')
+# Shared generation settings for every answer. Batched answers get a JSON reply
+# and room for several answers.
+GEN_CFG = {"temperature": 0, "max_output_tokens": 1024}
+BATCH_GEN_CFG = {"temperature": 0, "max_output_tokens": 8192, "response_mime_type": "application/json"}
 
-def scrape_website(url):
-    """Scrapes the text content from a given URL."""
-    print(f"Scraping {url}...")
+def warm_up():
+    """Imports the Gemini client and makes a 1-token request so connection and
+    auth setup are done before the first question."""
     try:
-        response = requests.get(url, timeout=10)
+        get_model().generate_content("ping", generation_config={"max_output_tokens": 1})
+    except Exception:
+        pass  # The first real question will report any problem
+
+# Gemini context cache for the scraped document. Caching needs a versioned
+# model and a minimum of ~2048 tokens (~4 chars per token).
+CACHE_MODEL_NAME = 'models/gemini-2.0-flash-001'
+CACHE_MIN_CHARS = 8_000
+CACHE_TTL = datetime.timedelta(hours=1)
+document_cache = None
+
+# Inline prompts carry at most this many document tokens. The trimmed document
+# is prepared once per scrape so questions never re-tokenize it.
+DOCUMENT_TOKEN_BUDGET = 8_000
+prepared_document = None
+_token_counts = {}
+
+# Local cache of answers, persisted across runs
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'docsAgent')
+answer_cache = None
+
+AI_ERROR_MESSAGE = "Sorry, I encountered an error trying to answer your question."
+# Appended to answers that hit the output token limit; they are shown but
+# never stored in the answer cache
+TRUNCATED_NOTE = "\n[Answer cut off at the length limit.]"
+
+def is_cacheable(answer):
+    return answer != AI_ERROR_MESSAGE and not answer.endswith(TRUNCATED_NOTE)
+
+# Shared HTTP session so repeat scrapes reuse pooled keep-alive connections
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    # Transient failures are retried with exponential backoff, honouring Retry-After
+    max_retries=Retry(
+        total=3,
+        connect=3,
+        read=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+    ),
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+SESSION.headers.update({"Accept-Encoding": "gzip, deflate, br", "User-Agent": "docsAgent/1.0"})
+atexit.register(SESSION.close)
+
+# Pages are parsed up to this many bytes; the rest is not downloaded
+SCRAPE_MAX_BYTES = 5_000_000
+
+# Feeds downloaded chunks to lxml while the scraping thread keeps reading
+_PARSE_POOL = ThreadPoolExecutor(thread_name_prefix="parse")
+
+# Splits scraped text into phrases in one pass: at every line break (the same
+# characters str.splitlines() breaks on) and at runs of 2+ spaces/tabs, which
+# separate multi-headline phrases within a line
+_BREAKS = re.compile(r'\s*[\n\r\v\f\x1c-\x1e\x85\u2028\u2029]\s*|[ \t]{2,}')
+
+def clean_text(text):
+    """Breaks text into one phrase per line, trims each and drops blank ones."""
+    return '\n'.join(filter(None, (chunk.strip() for chunk in _BREAKS.split(text))))
+
+def make_parser(encoding):
+    from lxml import etree
+    try:
+        return etree.HTMLParser(target=TextTarget(), encoding=encoding)
+    except LookupError:
+        # libxml2 doesn't know this encoding name; let it detect one
+        return etree.HTMLParser(target=TextTarget())
+
+class TextTarget:
+    """lxml parser target that collects text outside script/style elements.
+
+    Text is gathered as the parser emits it, so no document tree is built.
+    Text inside the page's main content region (<main>, <article> or
+    role="main") is also kept separately so navigation chrome can be dropped.
+    """
+    SKIP_TAGS = {'script', 'style', 'noscript'}
+    CONTENT_TAGS = {'main', 'article'}
+
+    def __init__(self):
+        self.buf = []
+        self.content_buf = []
+        self.skip = 0
+        self.depth = 0
+        self.content_depth = None
+
+    def start(self, tag, attrib):
+        self.depth += 1
+        if self.content_depth is None and (tag in self.CONTENT_TAGS or attrib.get('role') == 'main'):
+            self.content_depth = self.depth
+        if tag in self.SKIP_TAGS:
+            self.skip += 1
+
+    def end(self, tag):
+        if tag in self.SKIP_TAGS and self.skip:
+            self.skip -= 1
+        if self.content_depth == self.depth:
+            self.content_depth = None
+        self.depth -= 1
+
+    def data(self, data):
+        if not self.skip:
+            self.buf.append(data)
+            if self.content_depth is not None:
+                self.content_buf.append(data)
+
+    def close(self):
+        # Fall back to the whole page when it has no main content region
+        content = ''.join(self.content_buf)
+        return content if content.strip() else ''.join(self.buf)
+
+def _page_cache_path(url):
+    return os.path.join(CACHE_DIR, 'pages', hashlib.sha256(url.encode()).hexdigest() + '.json')
+
+def load_cached_page(url):
+    """Returns the cached {etag, last_modified, text} for a URL, or None."""
+    try:
+        with open(_page_cache_path(url), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_cached_page(url, etag, last_modified, text):
+    """Stores scraped text with the validators needed to revalidate it."""
+    if not (etag or last_modified):
+        return
+    path = _page_cache_path(url)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'etag': etag, 'last_modified': last_modified, 'text': text}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not cache {url}: {e}")
+
+@functools.lru_cache(maxsize=32)
+def fetch_page_text(url):
+    """Downloads and extracts a page's text, raising on failure.
+
+    Results are memoized per URL for this run; across runs the on-disk cache
+    lets unchanged pages be revalidated without re-downloading them.
+    """
+    cached = load_cached_page(url)
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+    with SESSION.get(url, headers=headers, timeout=(3.05, 10), stream=True) as response:
+        if response.status_code == 304 and cached:
+            print("Page unchanged; using cached copy.")
+            return cached['text']
         response.raise_for_status()  # Raise an exception for bad status codes
-        soup = BeautifulSoup(response.content, 'html.parser')
+        declared = 'charset' in response.headers.get('content-type', '').lower()
+        parser = None
         
-        # Remove script and style elements
-        for script_or_style in soup(["script", "style"]):
-            script_or_style.decompose()
+        # Parse while downloading; script and style text is skipped by the target.
+        # One feed is in flight at a time so chunks reach the parser in order,
+        # while the next chunk is already being received.
+        pending = None
+        received = 0
+        for chunk in response.iter_content(chunk_size=65536):
+            if received + len(chunk) > SCRAPE_MAX_BYTES:
+                chunk = chunk[:SCRAPE_MAX_BYTES - received]
+            received += len(chunk)
+            if parser is None:
+                # Only trust a declared charset; otherwise sniff the first chunk
+                parser = make_parser(response.encoding if declared else sniff_encoding(chunk))
+            if pending:
+                pending.result()
+            pending = _PARSE_POOL.submit(parser.feed, chunk)
+            if received >= SCRAPE_MAX_BYTES:
+                print(f"Warning: {url} is larger than {SCRAPE_MAX_BYTES} bytes; only the first part was scraped.")
+                break
+        if pending:
+            pending.result()
         
         # Get text
-        text = soup.get_text()
-        
-        # Break into lines and remove leading/trailing space on each
-        lines = (line.strip() for line in text.splitlines())
-        # Break multi-headlines into a line each
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        # Drop blank lines
-        text = '\n'.join(chunk for chunk in chunks if chunk)
+        text = parser.close() if parser else ''
+    
+    text = clean_text(text)
+    save_cached_page(url, response.headers.get('ETag'), response.headers.get('Last-Modified'), text)
+    return text
+
+def scrape_website(url):
+    """Scrapes the text content from a given URL."""
+    from lxml import etree
+    print(f"Scraping {url}...")
+    try:
+        text = fetch_page_text(url)
         print("Scraping completed.")
         return text
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, etree.LxmlError) as e:
         print(f"Error scraping website: {e}")
         return None
 
-def ask_ai(document_text, question):
-    """Asks the Gemini AI a question based on the provided document text."""
+async def scrape_websites(urls):
+    """Scrapes several URLs concurrently and combines their text."""
+    # Each scrape blocks on the shared session in its own thread, so network
+    # waits overlap and lxml parsing (which releases the GIL) runs in parallel.
+    texts = await asyncio.gather(*(asyncio.to_thread(scrape_website, url) for url in urls))
+    if len(urls) == 1:
+        return texts[0]
+    return '\n\n'.join(f"Content from {url}:\n{text}" for url, text in zip(urls, texts) if text)
+
+class AnswerCache:
+    """Caches answers to questions about one document in SQLite.
+
+    A question is first looked up by an exact hash of (document, question).
+    If sentence-transformers is installed, a miss then falls back to the
+    closest earlier question by embedding, accepted when its cosine
+    similarity reaches the threshold. The least recently used entries beyond
+    max_entries are evicted.
+    """
+    EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+    def __init__(self, document_text, path=os.path.join(CACHE_DIR, 'answers.sqlite3'), max_entries=1000, threshold=0.92):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS answers "
+            "(key TEXT PRIMARY KEY, doc_hash TEXT, embedding BLOB, answer TEXT, last_used REAL)"
+        )
+        self.doc_hash = hashlib.sha256(document_text.encode()).hexdigest()
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.encoder = None
+        # Embedding matrix of this document's cached questions, row-aligned with keys
+        self.keys = []
+        self.embeddings = None
+
+    def _key(self, question):
+        return hashlib.sha256(f"{self.doc_hash}\n{question.strip().lower()}".encode()).hexdigest()
+
+    def _encode(self, question):
+        if self.encoder is False:
+            return None
+        try:
+            import numpy as np
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            self.encoder = False  # Optional; only exact matches are cached
+            return None
+        if self.encoder is None:
+            self.encoder = SentenceTransformer(self.EMBEDDING_MODEL)
+            self._load_embeddings()
+        return self.encoder.encode(question, normalize_embeddings=True).astype(np.float32)
+
+    def _load_embeddings(self):
+        """Rebuilds the embedding matrix from the rows currently in SQLite."""
+        import numpy as np
+        rows = self.db.execute(
+            "SELECT key, embedding FROM answers WHERE doc_hash = ? AND embedding IS NOT NULL", (self.doc_hash,)
+        ).fetchall()
+        self.keys = [key for key, _ in rows]
+        self.embeddings = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows]) if rows else None
+
+    def lookup(self, question):
+        """Returns (cached answer or None, question embedding or None)."""
+        key = self._key(question)
+        row = self.db.execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+        embedding = None
+        if not row:
+            embedding = self._encode(question)
+            if embedding is not None and self.embeddings is not None:
+                import numpy as np
+                sims = self.embeddings @ embedding
+                # Best match first; skip rows another process has since evicted
+                for best in np.argsort(-sims):
+                    if sims[best] < self.threshold:
+                        break
+                    key = self.keys[best]
+                    row = self.db.execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+                    if row:
+                        break
+        if not row:
+            return None, embedding
+        self.db.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        return row[0], embedding
+
+    def store(self, question, embedding, answer):
+        key = self._key(question)
+        self.db.execute(
+            "INSERT OR REPLACE INTO answers (key, doc_hash, embedding, answer, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, self.doc_hash, embedding.tobytes() if embedding is not None else None, answer, time.time()),
+        )
+        evicted = self.db.execute(
+            "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        self.db.commit()
+        if not self.encoder:
+            return
+        if evicted or (key in self.keys and embedding is None):
+            # Keep the matrix row-aligned with what SQLite still holds
+            self._load_embeddings()
+        elif key in self.keys:
+            self.embeddings[self.keys.index(key)] = embedding
+        elif embedding is not None:
+            import numpy as np
+            self.keys.append(key)
+            self.embeddings = embedding[None, :] if self.embeddings is None else np.vstack([self.embeddings, embedding])
+
+def count_tokens(text):
+    """Counts tokens with the Gemini tokenizer, memoized by text hash."""
+    key = hash(text)
+    if key not in _token_counts:
+        _token_counts[key] = get_model().count_tokens(text).total_tokens
+    return _token_counts[key]
+
+def prepare_document(document_text, budget=DOCUMENT_TOKEN_BUDGET):
+    """Trims the document to a prefix that fits the token budget.
+
+    The cut is estimated from the document's chars-per-token ratio and checked
+    with a count, deliberately leaving 5-10% of the budget unused. It is not
+    the longest prefix that fits: finding that by binary search costs ~15
+    count_tokens calls, each uploading the prefix.
+    """
+    try:
+        tokens = count_tokens(document_text)
+        if tokens <= budget:
+            return document_text
+        # Estimate the cut from the chars-per-token ratio with 5% headroom, and
+        # verify it; a miss rescales from the prefix just measured. Each count
+        # uploads the text, so this stays at a handful of calls.
+        cut = len(document_text)
+        for _ in range(3):
+            cut = int(cut * budget / tokens * 0.95)
+            tokens = count_tokens(document_text[:cut])
+            if tokens <= budget:
+                return document_text[:cut]
+        return document_text[:int(cut * budget / tokens * 0.9)]
+    except Exception as e:
+        print(f"Could not count document tokens, using a character limit instead: {e}")
+        return document_text[:10000]
+
+def create_document_cache(document_text):
+    """Uploads the document to a Gemini context cache so questions don't resend it."""
+    if len(document_text) < CACHE_MIN_CHARS:
+        return None
+    import google.generativeai as genai
+    try:
+        get_model()  # Configures the API key
+        cache = genai.caching.CachedContent.create(
+            model=CACHE_MODEL_NAME,
+            system_instruction="Answer the user's questions from the document.",
+            contents=[document_text],
+            ttl=CACHE_TTL,
+        )
+        print("Document cached for follow-up questions.")
+        return cache
+    except Exception as e:
+        print(f"Could not cache the document, sending it with each question instead: {e}")
+        return None
+
+def prompt_document(document_text):
+    return prepared_document if prepared_document is not None else document_text[:10000]
+
+def hit_token_limit(response):
+    return bool(response.candidates) and response.candidates[0].finish_reason.name == 'MAX_TOKENS'
+
+def generate_answer(gen_model, prompt, stream):
+    """Returns the answer text. When streaming, chunks are printed as they
+    arrive and None is returned if the stream breaks off."""
+    from google.api_core import exceptions as google_exceptions
+    if not stream:
+        response = gen_model.generate_content(prompt, generation_config=GEN_CFG)
+        print("AI response received.")
+        return response.text + TRUNCATED_NOTE if hit_token_limit(response) else response.text
+    response = gen_model.generate_content(prompt, generation_config=GEN_CFG, stream=True)
+    print("\nAI Agent: ", end="", flush=True)
+    parts = []
+    chunk = None
+    try:
+        for chunk in response:
+            sys.stdout.write(chunk.text)
+            sys.stdout.flush()
+            parts.append(chunk.text)
+    except (google_exceptions.GoogleAPIError, ValueError) as e:
+        # Keep whatever was already shown rather than discarding it
+        print(f"\n[Response interrupted: {e}]" if parts else AI_ERROR_MESSAGE)
+        return None
+    # The final chunk carries the finish reason
+    if chunk is not None and hit_token_limit(chunk):
+        parts.append(TRUNCATED_NOTE)
+        sys.stdout.write(TRUNCATED_NOTE)
+    print()
+    return "".join(parts)
+
+def ask_ai(document_text, question, stream=False):
+    """Asks the Gemini AI a question based on the provided document text.
+
+    With stream=True the answer is printed as it is generated.
+    """
+    import google.generativeai as genai
+    from google.api_core import exceptions as google_exceptions
+    global document_cache
     if not document_text:
         return "I don't have any document content to answer from."
 
     print("Asking AI...")
     try:
-        prompt = f"Based on the following document, please answer the question.\n\nDocument:\n{document_text[:10000]} \n\nQuestion: {question}"
-        response = model.generate_content(prompt)
-        print("AI response received.")
-        return response.text
+        answer = None
+        if document_cache:
+            try:
+                answer = generate_answer(genai.GenerativeModel.from_cached_content(document_cache), question, stream)
+            except google_exceptions.NotFound:
+                # The cache expired; upload the document again for this and later
+                # questions, falling back to an inline prompt if that fails
+                document_cache = create_document_cache(document_text)
+                if document_cache:
+                    answer = generate_answer(genai.GenerativeModel.from_cached_content(document_cache), question, stream)
+        if not document_cache:
+            prompt = f"Based on the following document, please answer the question.\n\nDocument:\n{prompt_document(document_text)} \n\nQuestion: {question}"
+            answer = generate_answer(get_model(), prompt, stream)
+        return answer if answer is not None else AI_ERROR_MESSAGE
     except Exception as e:
         print(f"Error interacting with AI: {e}")
-        return "Sorry, I encountered an error trying to answer your question."
+        if stream:
+            print(f"\nAI Agent: {AI_ERROR_MESSAGE}")
+        return AI_ERROR_MESSAGE
+
+def ask_ai_batch(document_text, questions):
+    """Answers several questions with one Gemini call so the document is sent only once."""
+    if len(questions) == 1:
+        return [ask_ai(document_text, questions[0])]
+
+    numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1))
+    instructions = (
+        f"Answer each of the following questions. Reply with only a JSON array of "
+        f"{len(questions)} answer strings, in the same order.\n\nQuestions:\n{numbered}"
+    )
+    import google.generativeai as genai
+    print(f"Asking AI {len(questions)} questions in one request...")
+    try:
+        if document_cache:
+            batch_model = genai.GenerativeModel.from_cached_content(document_cache)
+            response = batch_model.generate_content(instructions, generation_config=BATCH_GEN_CFG)
+        else:
+            prompt = f"Based on the following document, please answer the questions.\n\nDocument:\n{prompt_document(document_text)} \n\n{instructions}"
+            response = get_model().generate_content(prompt, generation_config=BATCH_GEN_CFG)
+        answers = json.loads(response.text)
+        if isinstance(answers, list) and len(answers) == len(questions) and not hit_token_limit(response):
+            print("AI response received.")
+            return [str(answer) for answer in answers]
+        print("AI returned a malformed batch, asking the questions one at a time.")
+    except Exception as e:
+        print(f"Batched request failed, asking the questions one at a time: {e}")
+    return [ask_ai(document_text, question) for question in questions]
+
+def answer_questions(document_text, questions):
+    """Answers questions from the answer cache where possible and batches the rest."""
+    answers = {}
+    misses = []
+    for question in questions:
+        answer, question_embedding = answer_cache.lookup(question)
+        if answer is None:
+            misses.append((question, question_embedding))
+        else:
+            answers[question] = answer
+    if misses:
+        batch_answers = ask_ai_batch(document_text, [question for question, _ in misses])
+        for (question, question_embedding), answer in zip(misses, batch_answers):
+            answers[question] = answer
+            if is_cacheable(answer):
+                answer_cache.store(question, question_embedding, answer)
+    return [answers[question] for question in questions]
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Ask questions about documentation pages.")
+    arg_parser.add_argument("--questions", help="file with one question per line, answered in a single batched request")
+    args = arg_parser.parse_args()
+    # Read the questions before scraping so a bad path fails fast
+    queued_questions = []
+    if args.questions:
+        try:
+            with open(args.questions, encoding="utf-8") as f:
+                queued_questions = [line.strip() for line in f if line.strip()]
+        except (OSError, UnicodeDecodeError) as e:
+            arg_parser.error(f"cannot read --questions file: {e}")
+
     print("Starting AI Agent Prototype...")
-    doc_url = input("Enter the URL of the documentation to scrape: ")
-    scraped_content = scrape_website(doc_url)
+    threading.Thread(target=warm_up, daemon=True).start()
+    doc_urls = input("Enter the URL(s) of the documentation to scrape (separated by spaces): ").split()
+    scraped_content = asyncio.run(scrape_websites(doc_urls)) if doc_urls else None
 
     if scraped_content:
-        print(f"\nSuccessfully scraped {len(scraped_content)} characters from the URL.")
+        print(f"\nSuccessfully scraped {len(scraped_content)} characters from {len(doc_urls)} URL(s).")
+        document_cache = create_document_cache(scraped_content)
+        if not document_cache:
+            prepared_document = prepare_document(scraped_content)
+        answer_cache = AnswerCache(scraped_content)
+        if queued_questions:
+            for question, answer in zip(queued_questions, answer_questions(scraped_content, queued_questions)):
+                print(f"\nQ: {question}\nAI Agent: {answer}")
         while True:
             user_question = input("\nAsk a question about the document (or type 'exit' to quit): ")
             if user_question.lower() == 'exit':
@@ -76,8 +557,14 @@ if __name__ == "__main__":
             if not user_question.strip():
                 print("Please enter a question.")
                 continue
-            answer = ask_ai(scraped_content, user_question)
-            print(f"\nAI Agent: {answer}")
+            answer, question_embedding = answer_cache.lookup(user_question)
+            if answer is not None:
+                print(f"\nAI Agent: {answer}")
+                continue
+            # Streamed: the answer is printed while it is generated
+            answer = ask_ai(scraped_content, user_question, stream=True)
+            if is_cacheable(answer):
+                answer_cache.store(user_question, question_embedding, answer)
     else:
         print("Could not scrape any content. Please check the URL and your internet connection.")
     
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The app modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# main.py exits at import without a key; the tests never call Gemini
+os.environ.setdefault("GEMINI_API_KEY", "test")
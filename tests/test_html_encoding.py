@@ -0,0 +1,40 @@
+from lxml import etree
+
+from html_encoding import sniff_encoding
+
+GERMAN = "Größe der Datei übergeben, Änderungen müssen geprüft werden."
+PORTUGUESE = "Introdução às funções de manipulação de dados."
+FRENCH = "Une approche naïve, déjà vue à côté du théâtre."
+
+
+def parse_text(body):
+    parser = etree.HTMLParser(encoding=sniff_encoding(body))
+    parser.feed(body)
+    return "".join(parser.close().itertext())
+
+
+def page(text):
+    return f"<html><head><title>Docs</title></head><body><p>{text}</p></body></html>"
+
+
+def test_charset_less_cp1252_pages_decode_as_cp1252():
+    for text in (GERMAN, PORTUGUESE, FRENCH):
+        body = page(text).encode("cp1252")
+        assert sniff_encoding(body) == "cp1252"
+        assert text in parse_text(body)
+
+
+def test_charset_less_utf8_page_decodes_as_utf8():
+    body = page(GERMAN).encode("utf-8")
+    assert sniff_encoding(body) == "utf-8"
+    assert GERMAN in parse_text(body)
+
+
+def test_utf8_character_split_at_chunk_end_is_still_utf8():
+    assert sniff_encoding("<p>café".encode("utf-8")[:-1]) == "utf-8"
+
+
+def test_meta_charset_is_left_to_lxml():
+    body = f'<html><head><meta charset="windows-1252"></head><body><p>{GERMAN}</p></body></html>'.encode("cp1252")
+    assert sniff_encoding(body) is None
+    assert GERMAN in parse_text(body)
@@ -0,0 +1,46 @@
+import re
+
+import main
+
+_WS = re.compile(r'[ \t]{2,}')
+
+
+def old_clean_text(text):
+    """The splitlines/split/strip pipeline that _BREAKS replaced."""
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in _WS.split(line))
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
+
+def page_text(html):
+    parser = main.make_parser('utf-8')
+    parser.feed(html.encode('utf-8'))
+    return parser.close()
+
+
+TEXTS = [
+    "  a  \t  b \t c\t\td  ",
+    "one\r\ntwo\rthree\n\n\n  four  ",
+    "x\x0cy\x0bz\x1c\x1d\x1eq\x85r s t",
+    "\xa0 lead\xa0\xa0nbsp  \xa0  tail \xa0",
+    " \t \n \t ",
+    "",
+]
+
+PAGES = [
+    "<html><body><div>\n  <div>\n    <p>  Heading  </p>\n\n\n    <p>Body   text\ttabs</p>\n  </div>\n</div></body></html>",
+    "<p>line one<br><br><br>line two<br/>\n<br>\n  line three</p>",
+    "<main><ul>\n<li> a </li>\n<li>\tb\t\t</li></ul></main><footer>nav   links</footer>",
+    "<p>keep<script>var x = 1;\n\n</script> this<style>p { }</style>  text</p>",
+]
+
+
+def test_breaks_matches_old_pipeline_on_raw_text():
+    for text in TEXTS:
+        assert main.clean_text(text) == old_clean_text(text)
+
+
+def test_breaks_matches_old_pipeline_on_parsed_pages():
+    for html in PAGES:
+        text = page_text(html)
+        assert main.clean_text(text) == old_clean_text(text)